@@ -2,24 +2,84 @@ import pandas as pd
 import numpy as np
 
 
-def top_artistas(df: pd.DataFrame, n: int = 20) -> pd.Series:
+# Columnas del historial procesado que usan las consultas; el resto se deriva
+COLUMNAS_HISTORIAL = ["fecha_reproduccion", "artista", "cancion", "minutos_reproducidos"]
+BLOQUES_HORARIOS = ["madrugada", "manana", "tarde", "noche"]
+DIAS_SEMANA = [
+    "Monday", "Tuesday", "Wednesday",
+    "Thursday", "Friday", "Saturday", "Sunday",
+]
+
+
+def agregar_columnas_derivadas(df: pd.DataFrame) -> pd.DataFrame:
     """
-    Regresa los n artistas más escuchados por minutos.
+    Agrega las columnas derivadas que usan las consultas, calculadas una sola vez
+    a partir de COLUMNAS_HISTORIAL:
+    - fecha: día de la reproducción (datetime64 truncado a día)
+    - anio / mes / hora: enteros angostos (int16 / int8 / int8)
+    - anio_mes: primer día del mes (datetime64)
+    - dia_semana: código int8 del día (0=lunes ... 6=domingo)
+    - bloque_horario: código int8 del bloque de 6 horas (0=madrugada ... 3=noche)
+    Además convierte artista y cancion a category para agrupar por códigos enteros
+    y minutos_reproducidos a float32 para reducir memoria.
     """
-    return (
-        df.groupby("artista")["minutos_reproducidos"]
-          .sum()
-          .sort_values(ascending=False)
-          .head(n)
+    fechas = df["fecha_reproduccion"].dt
+    hora = fechas.hour.astype("int8")
+    return df.assign(
+        artista=df["artista"].astype("category"),
+        cancion=df["cancion"].astype("category"),
+        minutos_reproducidos=df["minutos_reproducidos"].astype("float32"),
+        fecha=df["fecha_reproduccion"].values.astype("datetime64[D]"),
+        anio=fechas.year.astype("int16"),
+        mes=fechas.month.astype("int8"),
+        anio_mes=df["fecha_reproduccion"].values.astype("datetime64[M]"),
+        hora=hora,
+        dia_semana=fechas.dayofweek.astype("int8"),
+        bloque_horario=hora.values // 6,
     )
 
 
+def _con_columnas_derivadas(df: pd.DataFrame, *columnas: str) -> pd.DataFrame:
+    """
+    Regresa df tal cual si ya tiene las columnas derivadas pedidas; si no
+    (por ejemplo, un pd.read_csv directo del historial), las agrega.
+    """
+    if all(c in df.columns for c in columnas):
+        return df
+    return agregar_columnas_derivadas(df)
+
+
+def _como_categoria(serie: pd.Series) -> pd.Series:
+    """
+    Regresa la serie como category (sin copiar si ya lo es).
+    """
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        return serie
+    return serie.astype("category")
+
+
+def minutos_por_artista(df: pd.DataFrame) -> pd.Series:
+    """
+    Minutos totales reproducidos por artista (sin ordenar).
+    """
+    return df.groupby("artista", observed=True, sort=False)["minutos_reproducidos"].sum()
+
+
+def top_artistas(df: pd.DataFrame, n: int = 20, por_artista: pd.Series = None) -> pd.Series:
+    """
+    Regresa los n artistas más escuchados por minutos.
+    """
+    if por_artista is None:
+        por_artista = minutos_por_artista(df)
+    return por_artista.nlargest(n)
+
+
 def minutos_por_hora(df: pd.DataFrame) -> pd.Series:
     """
     Minutos totales reproducidos por hora del día (0-23).
     """
     return (
-        df.groupby("hora")["minutos_reproducidos"]
+        df.groupby("hora", observed=True, sort=False)["minutos_reproducidos"]
           .sum()
           .sort_values()
     )
@@ -27,31 +87,46 @@ def minutos_por_hora(df: pd.DataFrame) -> pd.Series:
 
 def minutos_por_dia_semana(df: pd.DataFrame) -> pd.Series:
     """
-    Minutos totales reproducidos por día de la semana.
+    Minutos totales reproducidos por día de la semana,
+    indexados por código de día (0=lunes ... 6=domingo, ver DIAS_SEMANA).
+    Acepta dia_semana como código entero o como nombre en inglés (CSV limpio).
     """
-    orden_dias = [
-        "Monday", "Tuesday", "Wednesday",
-        "Thursday", "Friday", "Saturday", "Sunday",
-    ]
-
-    serie = df.groupby("dia_semana")["minutos_reproducidos"].sum()
-    serie = serie.reindex(orden_dias).dropna()
+    dia_semana = df["dia_semana"]
+    if not pd.api.types.is_integer_dtype(dia_semana):
+        # Nombres de día -> códigos; un nombre desconocido es un error, no un resultado vacío
+        dia_semana = dia_semana.map({dia: i for i, dia in enumerate(DIAS_SEMANA)})
+        if dia_semana.isna().any():
+            desconocidos = df.loc[dia_semana.isna(), "dia_semana"].unique()[:5]
+            raise ValueError(f"Valores de dia_semana no reconocidos: {list(desconocidos)}")
+        dia_semana = dia_semana.astype("int8")
+
+    serie = df["minutos_reproducidos"].groupby(dia_semana, sort=False).sum()
+    serie = serie.reindex(range(len(DIAS_SEMANA))).dropna()
     return serie
 
 
 def minutos_por_anio_mes(df: pd.DataFrame) -> pd.DataFrame:
     """
     Minutos totales reproducidos por año y mes.
+    Incluye la columna anio_mes (primer día del mes) lista para graficar.
     """
-    tabla = (
-        df.groupby(["anio", "mes"])["minutos_reproducidos"]
+    df = _con_columnas_derivadas(df, "anio_mes")
+
+    # Una sola llave datetime64 (anio_mes) en lugar de la llave compuesta anio + mes
+    serie = (
+        df.groupby("anio_mes", observed=True, sort=False)["minutos_reproducidos"]
           .sum()
-          .reset_index()
-          .sort_values(["anio", "mes"])
+          .sort_index()
     )
+    tabla = pd.DataFrame({
+        "anio_mes": serie.index,
+        "anio": serie.index.year.astype("int16"),
+        "mes": serie.index.month.astype("int8"),
+        "minutos_reproducidos": serie.values,
+    })
     return tabla
 
-def indice_obsesion(df: pd.DataFrame, n: int = 10) -> float:
+def indice_obsesion(df: pd.DataFrame, n: int = 10, por_artista: pd.Series = None) -> float:
     """
     Porcentaje de minutos totales concentrados en los n artistas más escuchados.
     """
@@ -59,43 +134,45 @@ def indice_obsesion(df: pd.DataFrame, n: int = 10) -> float:
     if total == 0:
         return 0.0
 
-    top_n = (
-        df.groupby("artista")["minutos_reproducidos"]
-          .sum()
-          .sort_values(ascending=False)
-          .head(n)
-          .sum()
-    )
+    if por_artista is None:
+        por_artista = minutos_por_artista(df)
+
+    top_n = por_artista.nlargest(n).sum()
     return round((top_n / total) * 100, 2)
 
+def minutos_por_dia(df: pd.DataFrame) -> pd.Series:
+    """
+    Minutos totales reproducidos por fecha (sin ordenar).
+    Se calcula una vez y se comparte entre las consultas diarias.
+    """
+    df = _con_columnas_derivadas(df, "fecha")
+    return df.groupby("fecha", observed=True, sort=False)["minutos_reproducidos"].sum()
+
 def resumen_entre_semana_vs_fin(
     df: pd.DataFrame,
-    umbral_minutos_dia: float = 0.0
+    umbral_minutos_dia: float = 0.0,
+    diarios: pd.Series = None,
 ) -> pd.DataFrame:
     """
     Compara entre semana (Mon-Thu) vs fin de semana (Fri-Sun).
     Devuelve minutos totales y promedio por día (solo días con minutos >= umbral).
     """
-    df = df.copy()
-    df["fecha"] = df["fecha_reproduccion"].dt.date
-
-    # Clasificar días
-    dias_fin = {"Friday", "Saturday", "Sunday"}
-    df["grupo"] = np.where(df["dia_semana"].isin(dias_fin),
-                           "fin_de_semana", "entre_semana")
-
-    # Minutos por fecha y grupo
-    diarios = (
-        df.groupby(["grupo", "fecha"])["minutos_reproducidos"]
-          .sum()
-          .reset_index()
-    )
+    if diarios is None:
+        diarios = minutos_por_dia(df)
 
     if umbral_minutos_dia > 0:
-        diarios = diarios[diarios["minutos_reproducidos"] >= umbral_minutos_dia]
+        diarios = diarios[diarios >= umbral_minutos_dia]
+
+    # Clasificar días (4-6 = viernes a domingo)
+    es_fin = diarios.index.dayofweek >= 4
+    grupo = pd.Series(
+        np.where(es_fin, "fin_de_semana", "entre_semana"),
+        index=diarios.index,
+        name="grupo",
+    )
 
     resumen = (
-        diarios.groupby("grupo")["minutos_reproducidos"]
+        diarios.groupby(grupo)
         .agg(
             minutos_totales="sum",
             minutos_promedio_por_dia="mean",
@@ -110,85 +187,79 @@ def minutos_por_bloque_horario(df: pd.DataFrame) -> pd.DataFrame:
     """
     Minutos totales por bloque horario con todos los bloques siempre presentes.
     """
-    df = df.copy()
-
-    condiciones = [
-        df["hora"].between(0, 5),
-        df["hora"].between(6, 11),
-        df["hora"].between(12, 17),
-        df["hora"].between(18, 23),
-    ]
-    bloques = ["madrugada", "manana", "tarde", "noche"]
-
-    df["bloque_horario"] = np.select(condiciones, bloques, default="desconocido")
+    df = _con_columnas_derivadas(df, "bloque_horario")
 
-    tabla = (
-        df.groupby("bloque_horario")["minutos_reproducidos"]
+    serie = (
+        df.groupby("bloque_horario", observed=True, sort=False)["minutos_reproducidos"]
           .sum()
-          .reindex(["madrugada", "manana", "tarde", "noche"], fill_value=0)
-          .reset_index()
+          .reindex(range(len(BLOQUES_HORARIOS)), fill_value=0)
     )
+    # Códigos 0..3 -> etiquetas, solo al final
+    serie.index = pd.Index(BLOQUES_HORARIOS, name="bloque_horario")
 
-    return tabla
+    return serie.reset_index()
 
-def dia_mas_musical(df: pd.DataFrame) -> pd.DataFrame:
+def dia_mas_musical(df: pd.DataFrame, diarios: pd.Series = None) -> pd.DataFrame:
     """
     Devuelve el día con más minutos reproducidos en todo el dataset,
     junto con su top artista de ese día.
     """
-    df = df.copy()
-    df["fecha"] = df["fecha_reproduccion"].dt.date
-
-    # Minutos por fecha
-    diarios = (
-        df.groupby("fecha")["minutos_reproducidos"]
-          .sum()
-          .reset_index()
-    )
+    if diarios is None:
+        diarios = minutos_por_dia(df)
 
     if diarios.empty:
-        return diarios
-
-    fila_top = diarios.loc[diarios["minutos_reproducidos"].idxmax()]
-    fecha_top = fila_top["fecha"]
-
-    # Top artista de ese día
-    en_dia = df[df["fecha"] == fecha_top]
-    artista_top = (
-        en_dia.groupby("artista")["minutos_reproducidos"]
-        .sum()
-        .sort_values(ascending=False)
-        .head(1)
-        .reset_index()
+        return diarios.reset_index()
+
+    fecha_top = diarios.idxmax()
+    df = _con_columnas_derivadas(df, "fecha")
+    artista = _como_categoria(df["artista"])
+
+    # Top artista de ese día: suma por código de artista solo en las filas de esa fecha
+    en_dia = df["fecha"].values == fecha_top.to_datetime64()
+    codigos = artista.cat.codes.values
+    en_dia &= codigos >= 0
+    sumas = np.bincount(
+        codigos[en_dia],
+        weights=df["minutos_reproducidos"].values[en_dia],
     )
+    mejor = sumas.argmax()
 
     resultado = pd.DataFrame({
-        "fecha": [fecha_top],
-        "minutos_reproducidos": [fila_top["minutos_reproducidos"]],
-        "top_artista": [artista_top.loc[0, "artista"]],
-        "minutos_top_artista": [artista_top.loc[0, "minutos_reproducidos"]],
+        "fecha": [fecha_top.date()],
+        "minutos_reproducidos": [diarios[fecha_top]],
+        "top_artista": [artista.cat.categories[mejor]],
+        "minutos_top_artista": [sumas[mejor]],
     })
 
     return resultado
 
+def _racha_mas_larga(dias: np.ndarray) -> tuple[int, int, int]:
+    """
+    Racha más larga de días consecutivos en un arreglo int64 ordenado de días.
+    Regresa (longitud, índice de inicio, índice de fin inclusivo).
+    """
+    # Una racha se corta donde la diferencia entre días no es 1
+    cortes = np.flatnonzero(np.diff(dias) != 1)
+    inicios = np.r_[0, cortes + 1]
+    fines = np.r_[cortes, len(dias) - 1]
+    longitudes = fines - inicios + 1
+
+    mejor = longitudes.argmax()
+    return int(longitudes[mejor]), int(inicios[mejor]), int(fines[mejor])
+
 def racha_musical_mas_larga(
     df: pd.DataFrame,
-    umbral_minutos_dia: float = 10.0
+    umbral_minutos_dia: float = 10.0,
+    diarios: pd.Series = None,
 ) -> dict:
     """
     Encuentra la racha más larga de días consecutivos con minutos >= umbral.
     Regresa un dict con longitud, fecha_inicio y fecha_fin.
     """
-    df = df.copy()
-    df["fecha"] = df["fecha_reproduccion"].dt.date
-
-    diarios = (
-        df.groupby("fecha")["minutos_reproducidos"]
-          .sum()
-          .reset_index()
-    )
+    if diarios is None:
+        diarios = minutos_por_dia(df)
 
-    activos = diarios[diarios["minutos_reproducidos"] >= umbral_minutos_dia].copy()
+    activos = diarios[diarios >= umbral_minutos_dia]
     if activos.empty:
         return {
             "longitud_racha": 0,
@@ -196,30 +267,12 @@ def racha_musical_mas_larga(
             "fecha_fin": None,
         }
 
-    activos = activos.sort_values("fecha").reset_index(drop=True)
-    fechas = pd.to_datetime(activos["fecha"])
-
-    max_len = 1
-    curr_len = 1
-    start_idx = 0
-    best_start_idx = 0
-
-    for i in range(1, len(fechas)):
-        if (fechas[i] - fechas[i - 1]).days == 1:
-            curr_len += 1
-        else:
-            if curr_len > max_len:
-                max_len = curr_len
-                best_start_idx = start_idx
-            curr_len = 1
-            start_idx = i
-
-    if curr_len > max_len:
-        max_len = curr_len
-        best_start_idx = start_idx
+    dias = np.sort(activos.index.values.astype("datetime64[D]").view("int64"))
+    max_len, inicio, fin = _racha_mas_larga(dias)
 
-    fecha_inicio = fechas.iloc[best_start_idx].date()
-    fecha_fin = (fechas.iloc[best_start_idx + max_len - 1]).date()
+    fechas = dias.view("datetime64[D]")
+    fecha_inicio = fechas[inicio].item()
+    fecha_fin = fechas[fin].item()
 
     return {
         "longitud_racha": int(max_len),
@@ -227,7 +280,35 @@ def racha_musical_mas_larga(
         "fecha_fin": fecha_fin,
     }
 
-def resumen_variabilidad_diaria(df: pd.DataFrame) -> dict:
+def rachas_por_umbral(diarios: pd.Series, umbrales) -> np.ndarray:
+    """
+    Longitud de la racha más larga de días consecutivos con minutos >= umbral,
+    para todos los umbrales en una sola pasada sobre los minutos por día.
+    """
+    umbrales = np.asarray(umbrales, dtype=np.float64)
+    if diarios.empty:
+        return np.zeros(len(umbrales), dtype=np.int64)
+
+    # Calendario denso; los días sin datos quedan en -inf y cortan cualquier racha
+    dias = diarios.index.values.astype("datetime64[D]").view("int64")
+    dias = dias - dias.min()
+    minutos = np.full(dias.max() + 1, -np.inf)
+    minutos[dias] = diarios.values
+
+    # Matriz días x umbrales con un borde False arriba y abajo
+    activos = np.zeros((len(minutos) + 2, len(umbrales)), dtype=np.int8)
+    activos[1:-1] = minutos[:, None] >= umbrales[None, :]
+
+    # Inicios (+1) y fines (-1) de cada racha, recorridos por columna
+    cambios = np.diff(activos, axis=0).T
+    col_inicio, fila_inicio = np.nonzero(cambios == 1)
+    _, fila_fin = np.nonzero(cambios == -1)
+
+    longitudes = np.zeros(len(umbrales), dtype=np.int64)
+    np.maximum.at(longitudes, col_inicio, fila_fin - fila_inicio)
+    return longitudes
+
+def resumen_variabilidad_diaria(df: pd.DataFrame, diarios: pd.Series = None) -> dict:
     """
     Calcula resumen de minutos por día:
     - promedio
@@ -236,26 +317,28 @@ def resumen_variabilidad_diaria(df: pd.DataFrame) -> dict:
     - dias_altos ( > 1.5 * promedio )
     - dias_bajos ( < 0.5 * promedio )
     """
-    df = df.copy()
-    df["fecha"] = df["fecha_reproduccion"].dt.date
-
-    diarios = (
-        df.groupby("fecha")["minutos_reproducidos"]
-          .sum()
-    )
+    if diarios is None:
+        diarios = minutos_por_dia(df)
 
     if diarios.empty:
         return {}
 
-    promedio = diarios.mean()
-    std = diarios.std()
+    v = diarios.values.astype(np.float64)
+    n = v.size
 
-    p25 = diarios.quantile(0.25)
-    p50 = diarios.quantile(0.50)
-    p75 = diarios.quantile(0.75)
+    promedio = v.mean()
+    std = v.std(ddof=1) if n > 1 else np.nan
 
-    dias_altos = int((diarios > 1.5 * promedio).sum())
-    dias_bajos = int((diarios < 0.5 * promedio).sum())
+    # Percentiles 25/50/75 con interpolación lineal (como Series.quantile),
+    # resueltos con una sola partición en lugar de tres ordenamientos
+    posiciones = np.array([0.25, 0.50, 0.75]) * (n - 1)
+    abajo = np.floor(posiciones).astype(np.intp)
+    arriba = np.ceil(posiciones).astype(np.intp)
+    parcial = np.partition(v, np.unique(np.r_[abajo, arriba]))
+    p25, p50, p75 = parcial[abajo] + (parcial[arriba] - parcial[abajo]) * (posiciones - abajo)
+
+    dias_altos = int((v > 1.5 * promedio).sum())
+    dias_bajos = int((v < 0.5 * promedio).sum())
 
     return {
         "promedio_minutos_por_dia": float(round(promedio, 2)),
@@ -265,22 +348,37 @@ def resumen_variabilidad_diaria(df: pd.DataFrame) -> dict:
         "percentil_75": float(round(p75, 2)),
         "dias_altos": dias_altos,
         "dias_bajos": dias_bajos,
-        "total_dias": int(len(diarios)),
+        "total_dias": int(n),
     }
 
 def top_canciones(df: pd.DataFrame, n: int = 20) -> pd.DataFrame:
     """
     Top n canciones por minutos, incluyendo artista.
     """
+    # Solo llaves + valor; el top se toma sobre la Series antes de armar la tabla
+    sub = df[["cancion", "artista", "minutos_reproducidos"]]
     tabla = (
-        df.groupby(["cancion", "artista"])["minutos_reproducidos"]
+        sub.groupby(["cancion", "artista"], observed=True, sort=False)["minutos_reproducidos"]
           .sum()
+          .nlargest(n)
           .reset_index()
-          .sort_values("minutos_reproducidos", ascending=False)
-          .head(n)
     )
     return tabla
 
+def _indices_top(valores: np.ndarray, n: int, mayores: bool = True) -> np.ndarray:
+    """
+    Índices de los n valores mayores (o menores), ordenados,
+    usando una partición parcial en lugar de ordenar todo el arreglo.
+    """
+    m = len(valores)
+    n = max(min(n, m), 0)
+    clave = -valores if mayores else valores
+    if 0 < n < m:
+        indices = np.argpartition(clave, n - 1)[:n]
+    else:
+        indices = np.arange(m)[:n]
+    return indices[np.argsort(clave[indices], kind="stable")]
+
 def artistas_emergentes_y_olvidados(df: pd.DataFrame, top_n: int = 10) -> dict:
     """
     Divide el año en dos mitades (según fecha mínima y máxima)
@@ -289,8 +387,6 @@ def artistas_emergentes_y_olvidados(df: pd.DataFrame, top_n: int = 10) -> dict:
     - emergentes: suben mas (H2 - H1 positivo)
     - olvidados: bajan mas (H2 - H1 negativo)
     """
-    df = df.copy()
-
     fecha_min = df["fecha_reproduccion"].min()
     fecha_max = df["fecha_reproduccion"].max()
     if pd.isna(fecha_min) or pd.isna(fecha_max):
@@ -298,28 +394,31 @@ def artistas_emergentes_y_olvidados(df: pd.DataFrame, top_n: int = 10) -> dict:
 
     corte = fecha_min + (fecha_max - fecha_min) / 2
 
-    df["mitad"] = np.where(df["fecha_reproduccion"] <= corte, "H1", "H2")
-
-    tabla = (
-        df.groupby(["artista", "mitad"])["minutos_reproducidos"]
-          .sum()
-          .reset_index()
-    )
-
-    pivot = tabla.pivot(index="artista", columns="mitad", values="minutos_reproducidos").fillna(0)
-
-    pivot["delta"] = pivot.get("H2", 0) - pivot.get("H1", 0)
-
-    emergentes = (
-        pivot.sort_values("delta", ascending=False)
-             .head(top_n)
-             .reset_index()
-    )
+    # Minutos por código de artista en cada mitad: dos bincount sobre arreglos contiguos
+    es_h2 = df["fecha_reproduccion"].values > corte.to_datetime64()
+    artista = _como_categoria(df["artista"])
+    codigos = artista.cat.codes.values.astype(np.intp)
+    minutos = df["minutos_reproducidos"].values
+    categorias = artista.cat.categories
+    k = len(categorias)
+
+    validos = codigos >= 0
+    en_h1 = validos & ~es_h2
+    en_h2 = validos & es_h2
+    h1 = np.bincount(codigos[en_h1], weights=minutos[en_h1], minlength=k)
+    h2 = np.bincount(codigos[en_h2], weights=minutos[en_h2], minlength=k)
+
+    # Solo artistas con reproducciones en este dataframe
+    presentes = np.flatnonzero(np.bincount(codigos[validos], minlength=k))
+    tabla = pd.DataFrame({
+        "artista": categorias[presentes],
+        "H1": h1[presentes],
+        "H2": h2[presentes],
+    })
+    tabla["delta"] = tabla["H2"] - tabla["H1"]
+    delta = tabla["delta"].values
 
-    olvidados = (
-        pivot.sort_values("delta", ascending=True)
-             .head(top_n)
-             .reset_index()
-    )
+    emergentes = tabla.iloc[_indices_top(delta, top_n, mayores=True)].reset_index(drop=True)
+    olvidados = tabla.iloc[_indices_top(delta, top_n, mayores=False)].reset_index(drop=True)
 
-    return {"emergentes": emergentes, "olvidados": olvidados}
\ No newline at end of file
+    return {"emergentes": emergentes, "olvidados": olvidados}
@@ -0,0 +1,43 @@
+"""
+Convierte los historiales procesados (datos/procesados/<nombre>_limpio.csv)
+a Parquet comprimido con zstd. Solo guarda COLUMNAS_HISTORIAL, con artista y
+cancion ya como category; el dashboard lee el Parquet si existe y deriva el resto.
+
+Uso (desde la raíz del proyecto):
+    python src/analitica_spotify/convertir_parquet.py
+"""
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+# Ruta raíz del proyecto (Proyecto_Spotify_Analytics)
+RUTA_RAIZ = Path(__file__).resolve().parents[2]
+if str(RUTA_RAIZ) not in sys.path:
+    sys.path.append(str(RUTA_RAIZ))
+
+from src.analitica_spotify.consultas import COLUMNAS_HISTORIAL, agregar_columnas_derivadas
+
+
+def convertir_a_parquet(nombre: str) -> Path:
+    """
+    Lee <nombre>_limpio.csv y escribe <nombre>_limpio.parquet junto al CSV
+    con las columnas que usa el dashboard ya tipadas.
+    """
+    ruta_csv = RUTA_RAIZ / "datos" / "procesados" / f"{nombre}_limpio.csv"
+    df = pd.read_csv(ruta_csv, usecols=COLUMNAS_HISTORIAL, parse_dates=["fecha_reproduccion"])
+    df = agregar_columnas_derivadas(df)[COLUMNAS_HISTORIAL]
+
+    ruta_parquet = ruta_csv.with_suffix(".parquet")
+    df.to_parquet(ruta_parquet, compression="zstd", index=False)
+    return ruta_parquet
+
+
+def main():
+    for nombre in ["elias", "elie"]:
+        print("Convirtiendo:", nombre)
+        print("  ->", convertir_a_parquet(nombre))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import sys
+from io import BytesIO
 from pathlib import Path
 
 import pandas as pd
@@ -13,172 +14,480 @@ if str(RUTA_RAIZ) not in sys.path:
     sys.path.append(str(RUTA_RAIZ))
 
 from src.analitica_spotify.consultas import (
+    COLUMNAS_HISTORIAL,
+    DIAS_SEMANA,
+    agregar_columnas_derivadas,
     top_artistas,
     minutos_por_anio_mes,
-    indice_obsesion,
+    minutos_por_artista,
+    minutos_por_dia,
     minutos_por_dia_semana,
     minutos_por_bloque_horario,
     resumen_entre_semana_vs_fin,
     resumen_variabilidad_diaria,
     racha_musical_mas_larga,
+    rachas_por_umbral,
     top_canciones,
     artistas_emergentes_y_olvidados
 )
 
-def cargar_imagenes_artistas() -> pd.DataFrame:
+USUARIOS = ["Elias", "elie"]
+
+# Umbrales de minutos por día para la gráfica de rachas
+UMBRALES_RACHA = tuple(range(5, 125, 5))
+
+# Catálogo de imágenes de artistas (columnas: usuario, artista, url_imagen)
+RUTA_IMAGENES_ARTISTAS = RUTA_RAIZ / "datos" / "aux" / "imagenes_artistas.csv"
+
+@st.cache_data(show_spinner=False)
+def cargar_imagenes_artistas(mtime: float = None) -> dict:
     """
-    Carga el catálogo de imágenes de artistas para el usuario dado.
-    Espera un CSV en datos/aux:
-      - imagenes_artistas_elias.csv
-      - imagenes_artistas_elie.csv
-    con columnas: artista, url_imagen
+    Carga el catálogo de imágenes de artistas como diccionario
+    {(usuario, artista): url_imagen}.
+    Espera un CSV en datos/aux/imagenes_artistas.csv
+    con columnas: usuario, artista, url_imagen
+    mtime solo forma parte de la llave del caché: si el catálogo cambia, se vuelve a leer.
     """
-    ruta_aux = RUTA_RAIZ / "datos" / "aux" / "imagenes_artistas.csv"
+    ruta_aux = RUTA_IMAGENES_ARTISTAS
 
     if not ruta_aux.exists():
-        return pd.DataFrame(columns=["usuario", "artista", "url_imagen"])
+        return {}
 
     try:
         df_img = pd.read_csv(ruta_aux)
         cols_min = {"usuario", "artista", "url_imagen"}
         if not cols_min.issubset(set(df_img.columns)):
-            return pd.DataFrame(columns=["usuario", "artista", "url_imagen"])
-        return df_img
+            return {}
+        return {
+            (str(usuario).strip().lower(), str(artista).strip()): url
+            for usuario, artista, url in df_img[["usuario", "artista", "url_imagen"]].itertuples(index=False)
+        }
     except Exception:
-        return pd.DataFrame(columns=["usuario", "artista", "url_imagen"])
+        return {}
 
-def imagen_cuadrada(path, size=160):
+@st.cache_data(persist="disk", show_spinner=False)
+def imagen_cuadrada_bytes(path: str, mtime: float, size: int = 160) -> bytes:
     """
-    Abre una imagen, la recorta al centro para que sea cuadrada
-    y la redimensiona al tamaño especificado.
+    Abre una imagen, la recorta al centro para que sea cuadrada,
+    la redimensiona al tamaño especificado y la devuelve en PNG.
+    Se cachea en disco para no decodificarla en cada rerun; mtime solo forma
+    parte de la llave, así al reemplazar el archivo se vuelve a procesar.
+    Los errores se propagan para que no queden cacheados.
     """
+    img = Image.open(path).convert("RGB")
+    w, h = img.size
+    
+    # Lado del cuadrado
+    side = min(w, h)
+    
+    # Coordenadas para recorte centrado
+    left = (w - side) // 2
+    top = (h - side) // 2
+    right = left + side
+    bottom = top + side
+
+    img = img.crop((left, top, right, bottom))
+    img = img.resize((size, size))
+
+    buffer = BytesIO()
+    img.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+def _imagen_cuadrada_o_none(ruta_img: Path, size: int = 160):
     try:
-        img = Image.open(path).convert("RGB")
-        w, h = img.size
-        
-        # Lado del cuadrado
-        side = min(w, h)
-        
-        # Coordenadas para recorte centrado
-        left = (w - side) // 2
-        top = (h - side) // 2
-        right = left + side
-        bottom = top + side
-
-        img = img.crop((left, top, right, bottom))
-        img = img.resize((size, size))
-        return img
-    except Exception as e:
+        return imagen_cuadrada_bytes(str(ruta_img), ruta_img.stat().st_mtime, size=size)
+    except Exception:
         return None
 
+@st.cache_resource(show_spinner=False, max_entries=2)
+def miniaturas_artistas(
+    mtime_catalogo: float = None, firma_imagenes: tuple = (), size: int = 160
+) -> dict:
+    """
+    Procesa una sola vez todas las imágenes locales del catálogo y
+    devuelve {(usuario, artista): bytes PNG}, compartido entre sesiones.
+    mtime_catalogo y firma_imagenes (ver firma_imagenes_artistas) solo forman
+    parte de la llave: si cambia el catálogo o alguna imagen, se vuelve a procesar.
+    """
+    miniaturas = {}
+    for llave, url in cargar_imagenes_artistas(mtime_catalogo).items():
+        if not isinstance(url, str) or url.strip() == "":
+            continue
+        if url.startswith(("http://", "https://")):
+            continue
+        ruta_img = RUTA_RAIZ / url
+        if ruta_img.exists():
+            img_proc = _imagen_cuadrada_o_none(ruta_img, size=size)
+            if img_proc is not None:
+                miniaturas[llave] = img_proc
+    return miniaturas
+
+def firma_imagenes_artistas(img_dict: dict) -> tuple:
+    """
+    Fecha de modificación de cada imagen local del catálogo (None si no existe).
+    """
+    return tuple(
+        _mtime(RUTA_RAIZ / url)
+        for url in dict.fromkeys(img_dict.values())
+        if isinstance(url, str) and url.strip() != ""
+        and not url.startswith(("http://", "https://"))
+    )
 
-def cargar_datos():
+
+def _mtime(ruta: Path):
     """
-    Carga elias_limpio.csv y elie_limpio.csv desde datos/procesados.
+    Fecha de modificación de un archivo, o None si no existe.
+    """
+    return ruta.stat().st_mtime if ruta.exists() else None
+
+
+def rutas_historial(nombre: str) -> tuple[Path, Path]:
+    """
+    Rutas (parquet, csv) del historial procesado de un usuario en datos/procesados.
     """
     ruta_datos = RUTA_RAIZ / "datos" / "procesados"
+    return ruta_datos / f"{nombre}_limpio.parquet", ruta_datos / f"{nombre}_limpio.csv"
 
-    try:
-        df_elias = pd.read_csv(
-            ruta_datos / "elias_limpio.csv",
-            parse_dates=["fecha_reproduccion"],
-        )
-    except FileNotFoundError:
-        st.error("No se encontró el archivo elias_limpio.csv en datos/procesados.")
-        df_elias = pd.DataFrame()
 
-    try:
-        df_elie = pd.read_csv(
-            ruta_datos / "elie_limpio.csv",
-            parse_dates=["fecha_reproduccion"],
-        )
-    except FileNotFoundError:
-        st.error("No se encontró el archivo elie_limpio.csv en datos/procesados.")
-        df_elie = pd.DataFrame()
+def ruta_historial(nombre: str) -> Path:
+    """
+    Ruta del historial procesado de un usuario en datos/procesados.
+    Prefiere <nombre>_limpio.parquet (ver convertir_parquet.py) solo si está
+    al día con el CSV; si el CSV es más nuevo (p. ej. se regeneró desde los
+    cuadernos) o el parquet no existe, usa el CSV.
+    """
+    ruta_parquet, ruta_csv = rutas_historial(nombre)
+    mtime_parquet, mtime_csv = _mtime(ruta_parquet), _mtime(ruta_csv)
+    if mtime_parquet is not None and (mtime_csv is None or mtime_parquet >= mtime_csv):
+        return ruta_parquet
+    return ruta_csv
 
-    return df_elias, df_elie
+
+@st.cache_data(show_spinner=False)
+def leer_historial(ruta: str, mtime: float) -> pd.DataFrame:
+    """
+    Lee un historial procesado: Parquet (tipado, sin parseo de texto)
+    o CSV con el motor pyarrow (lectura multihilo).
+    Solo se leen COLUMNAS_HISTORIAL; las demás se derivan al cargar.
+    mtime solo forma parte de la llave del caché: si el archivo cambia, se vuelve a leer.
+    """
+    if ruta.endswith(".parquet"):
+        return pd.read_parquet(ruta, engine="pyarrow", columns=COLUMNAS_HISTORIAL)
+    return pd.read_csv(
+        ruta,
+        engine="pyarrow",
+        usecols=COLUMNAS_HISTORIAL,
+        parse_dates=["fecha_reproduccion"],
+    )
 
 
-def preparar_df_conjunto(df_elias: pd.DataFrame, df_elie: pd.DataFrame) -> pd.DataFrame:
+def cargar_datos():
     """
-    Une los dataframes de Elias y elie en uno solo,
-    con columna 'usuario' = 'Elias' o 'elie'.
+    Carga los historiales de Elias y elie desde datos/procesados
+    (elias_limpio / elie_limpio, en Parquet o CSV).
     """
     frames = []
+    for nombre in ("elias", "elie"):
+        ruta = ruta_historial(nombre)
+        ruta_parquet, _ = rutas_historial(nombre)
+        if ruta != ruta_parquet and ruta_parquet.exists():
+            st.warning(
+                f"{nombre}_limpio.csv es más nuevo que {nombre}_limpio.parquet; "
+                "se usa el CSV. Vuelve a correr convertir_parquet.py para actualizarlo."
+            )
+        try:
+            frames.append(leer_historial(str(ruta), ruta.stat().st_mtime))
+        except FileNotFoundError:
+            st.error(f"No se encontró el archivo {nombre}_limpio.csv en datos/procesados.")
+            frames.append(pd.DataFrame())
 
-    if not df_elias.empty:
-        temp = df_elias.copy()
-        temp["usuario"] = "Elias"
-        frames.append(temp)
+    df_elias, df_elie = frames
+    return df_elias, df_elie
 
-    if not df_elie.empty:
-        temp = df_elie.copy()
-        temp["usuario"] = "elie"
-        frames.append(temp)
 
-    if not frames:
-        return pd.DataFrame()
+def firma_datos() -> tuple:
+    """
+    Fechas de modificación del parquet y del CSV de cada historial
+    procesado (None si no existe). Identifica la versión de los datos
+    en las llaves del caché.
+    """
+    return tuple(
+        _mtime(ruta)
+        for nombre in ("elias", "elie")
+        for ruta in rutas_historial(nombre)
+    )
 
-    df_conjunto = pd.concat(frames, ignore_index=True)
-    return df_conjunto
+
+def preparar_df_conjunto(
+    df_elias: pd.DataFrame, df_elie: pd.DataFrame
+) -> dict[str, pd.DataFrame]:
+    """
+    Agrupa los dataframes de Elias y elie por usuario, sin concatenarlos:
+    {"Elias": df_elias, "elie": df_elie}. Los usuarios sin datos se omiten.
+    """
+    return {
+        usuario: df_usuario
+        for usuario, df_usuario in zip(USUARIOS, [df_elias, df_elie])
+        if not df_usuario.empty
+    }
 
 
-def obsesion_multi(df: pd.DataFrame, niveles=(1, 5, 10)) -> dict:
+@st.cache_data(show_spinner=False)
+def preparar_df_conjunto_enriquecido(
+    _df_elias: pd.DataFrame, _df_elie: pd.DataFrame, firma: tuple
+) -> dict[str, pd.DataFrame]:
     """
-    Devuelve un dict con índice de obsesión para Top1, Top5 y Top10.
+    Agrega las columnas derivadas una sola vez al dataframe de cada usuario.
+    La llave del caché es la firma de los archivos (ver firma_datos),
+    así los dataframes no se hashean en cada rerun.
     """
-    return {f"top_{n}": indice_obsesion(df, n=n) for n in niveles}
+    return {
+        usuario: agregar_columnas_derivadas(df_usuario)
+        for usuario, df_usuario in preparar_df_conjunto(_df_elias, _df_elie).items()
+    }
+
 
-def preparar_pastel_obsesion(df_user: pd.DataFrame) -> pd.DataFrame:
-     """
+def obsesion_multi(df: pd.DataFrame, niveles=(1, 5, 10), por_artista: pd.Series = None) -> dict:
+    """
+    Devuelve un dict con índice de obsesión para Top1, Top5 y Top10.
+    Agrega por artista una sola vez y lee cada nivel del acumulado del top.
+    """
+    if por_artista is None:
+        por_artista = minutos_por_artista(df)
+
+    total = df["minutos_reproducidos"].sum()
+    acumulado = por_artista.nlargest(max(niveles)).cumsum()
+    if total == 0 or acumulado.empty:
+        return {f"top_{n}": 0.0 for n in niveles}
+
+    return {
+        f"top_{n}": round((acumulado.iloc[min(n, len(acumulado)) - 1] / total) * 100, 2)
+        for n in niveles
+    }
+
+def preparar_pastel_obsesion(
+    df_user: pd.DataFrame, por_artista: pd.Series = None, obs: dict = None
+) -> pd.DataFrame:
+    """
     Construye un dataframe con segmentos para un pastel:
     Top 1, Resto Top 5, Resto Top 10, Otros.
+    Reutiliza los índices de obsesion_multi si ya se calcularon.
     """
-     obs1 = indice_obsesion(df_user, n=1)
-     obs5 = indice_obsesion(df_user, n=5)
-     obs10 = indice_obsesion(df_user, n=10)
-     seg_top1 = obs1
-     seg_top5 = max(obs5 - obs1, 0)
-     seg_top10 = max(obs10 - obs5, 0)
-     seg_otros = max(100 - obs10, 0)
-     datos = {
-         "segmento": ["Top 1", "Resto Top 5", "Resto Top 10", "Otros"],
-         "porcentaje": [seg_top1, seg_top5, seg_top10, seg_otros],
-     }
-     df_pastel = pd.DataFrame(datos)
-     df_pastel = df_pastel[df_pastel["porcentaje"] > 0].reset_index(drop=True)
-     return df_pastel
-
-def construir_df_rachas(df_user: pd.DataFrame) -> pd.DataFrame:
+    if obs is None:
+        obs = obsesion_multi(df_user, por_artista=por_artista)
+    obs1, obs5, obs10 = obs["top_1"], obs["top_5"], obs["top_10"]
+    seg_top1 = obs1
+    seg_top5 = max(obs5 - obs1, 0)
+    seg_top10 = max(obs10 - obs5, 0)
+    seg_otros = max(100 - obs10, 0)
+    datos = {
+        "segmento": ["Top 1", "Resto Top 5", "Resto Top 10", "Otros"],
+        "porcentaje": [seg_top1, seg_top5, seg_top10, seg_otros],
+    }
+    df_pastel = pd.DataFrame(datos)
+    df_pastel = df_pastel[df_pastel["porcentaje"] > 0].reset_index(drop=True)
+    return df_pastel
+
+def construir_df_rachas(df_user: pd.DataFrame, diarios: pd.Series = None) -> pd.DataFrame:
     """
     Calcula la racha musical más larga para distintos umbrales
     de minutos por día y regresa un dataframe.
     """
-    umbrales = [5, 10, 15, 20, 25, 30, 35, 40, 45, 50, 55, 60, 65, 70, 75, 80, 85, 90, 95, 100, 105, 110, 115, 120]
-    longitudes = []
-    for u in umbrales:
-        info = racha_musical_mas_larga(df_user, umbral_minutos_dia=u)
-        longitudes.append(info.get("longitud_racha", 0))
+    if diarios is None:
+        diarios = minutos_por_dia(df_user)
+
+    longitudes = rachas_por_umbral(diarios, UMBRALES_RACHA)
     return pd.DataFrame(
-        {"umbral_minutos_dia": umbrales, "longitud_dias": longitudes}
+        {"umbral_minutos_dia": UMBRALES_RACHA, "longitud_dias": longitudes}
     )
 
-def render_tab_usuario(df_conjunto: pd.DataFrame, usuario: str, etiqueta: str):
+@st.cache_data(show_spinner=False)
+def calcular_analitica_usuario(usuario: str, firma: tuple, _df_user: pd.DataFrame) -> dict:
+    """
+    Calcula todas las consultas de la vista de un usuario en una sola pasada.
+    La llave del caché es (usuario, firma): cambiar de pestaña o de widget
+    no vuelve a agrupar, y el dataframe no se hashea en cada rerun.
+    """
+    # Agregaciones compartidas: minutos por día y por artista
+    diarios = minutos_por_dia(_df_user)
+    por_artista = minutos_por_artista(_df_user)
+    obsesion = obsesion_multi(_df_user, por_artista=por_artista)
+
+    return {
+        "top_artistas": top_artistas(_df_user, n=10, por_artista=por_artista),
+        "top_canciones": top_canciones(_df_user, n=10),
+        "obsesion": obsesion,
+        "pastel_obsesion": preparar_pastel_obsesion(_df_user, obs=obsesion),
+        "minutos_mes": minutos_por_anio_mes(_df_user),
+        "minutos_dia_semana": minutos_por_dia_semana(_df_user),
+        "minutos_bloque": minutos_por_bloque_horario(_df_user),
+        "resumen_semana": resumen_entre_semana_vs_fin(_df_user, diarios=diarios),
+        "variabilidad_diaria": resumen_variabilidad_diaria(_df_user, diarios=diarios),
+        "racha_30": racha_musical_mas_larga(_df_user, umbral_minutos_dia=30, diarios=diarios),
+        "rachas": construir_df_rachas(_df_user, diarios=diarios),
+        "emergentes_olvidados": artistas_emergentes_y_olvidados(_df_user, top_n=5),
+    }
+
+# 2 usuarios x 2 versiones de los datos; las figuras de firmas viejas se descartan
+@st.cache_resource(show_spinner=False, max_entries=4)
+def construir_figuras_usuario(
+    usuario: str, etiqueta: str, firma: tuple, _analitica: dict
+) -> dict:
+    """
+    Construye las gráficas de la vista de un usuario a partir de su analítica.
+    Se cachea por (usuario, etiqueta, firma) para no rearmar las figuras
+    de plotly en cada rerun; None indica que no hay datos para la gráfica.
+    """
+    figuras = {}
+
+    df_top_songs = _analitica["top_canciones"]
+    figuras["top_canciones"] = None
+    if not df_top_songs.empty:
+        fig_top_songs = px.bar(
+            df_top_songs,
+            x="cancion",
+            y="minutos_reproducidos",
+            title="Tus canciones más escuchadas",
+            labels={"cancion": "Canción", "minutos_reproducidos": "Minutos reproducidos"},
+            color_discrete_sequence=["#9467bd"],
+        )
+        fig_top_songs.update_layout(xaxis_tickangle=-45)
+        figuras["top_canciones"] = fig_top_songs
+
+    df_pastel = _analitica["pastel_obsesion"]
+    figuras["pastel_obsesion"] = None
+    if not df_pastel.empty:
+        fig_pastel = px.pie(
+            df_pastel,
+            names="segmento",
+            values="porcentaje",
+            hole=0.4,
+            title="Distribución de minutos entre tus artistas",
+        )
+        fig_pastel.update_traces(textposition="inside", textinfo="percent+label")
+        figuras["pastel_obsesion"] = fig_pastel
+
+    df_min = _analitica["minutos_mes"]
+    figuras["minutos_mes"] = None
+    if not df_min.empty:
+        figuras["minutos_mes"] = px.line(
+            df_min,
+            x="anio_mes",
+            y="minutos_reproducidos",
+            markers=True,
+            labels={
+                "anio_mes": "Mes",
+                "minutos_reproducidos": "Minutos reproducidos",
+            },
+            title=f"Minutos reproducidos por mes — {etiqueta}",
+            color_discrete_sequence=["#FF4B4B"],
+        )
+
+    df_dia = _analitica["minutos_dia_semana"]
+    figuras["minutos_dia_semana"] = None
+    if df_dia is not None and len(df_dia) > 0:
+        df_dia = df_dia.rename_axis("dia_semana").reset_index(name="minutos_reproducidos")
+        df_dia["dia_semana"] = df_dia["dia_semana"].map(dict(enumerate(DIAS_SEMANA)))
+
+        fig_dia = px.bar(
+            df_dia,
+            x="dia_semana",
+            y="minutos_reproducidos",
+            labels={
+                "dia_semana": "Día de la semana",
+                "minutos_reproducidos": "Minutos reproducidos",
+            },
+            title="¿Qué días escuchas más?",
+            color_discrete_sequence=["#1f77b4"],
+        )
+        fig_dia.update_layout(xaxis_tickangle=-30)
+        figuras["minutos_dia_semana"] = fig_dia
+
+    df_bloques = _analitica["minutos_bloque"]
+    figuras["minutos_bloque"] = None
+    if df_bloques is not None and len(df_bloques) > 0:
+        figuras["minutos_bloque"] = px.bar(
+            df_bloques,
+            x="bloque_horario",
+            y="minutos_reproducidos",
+            labels={
+                "bloque_horario": "Bloque horario",
+                "minutos_reproducidos": "Minutos reproducidos",
+            },
+            title="¿En qué momento del día escuchas más?",
+            color_discrete_sequence=["#ff7f0e"],
+        )
+
+    df_rachas = _analitica["rachas"]
+    figuras["rachas"] = None
+    if not df_rachas.empty:
+        figuras["rachas"] = px.bar(
+            df_rachas,
+            x="umbral_minutos_dia",
+            y="longitud_dias",
+            labels={
+                "umbral_minutos_dia": "Umbral (min/día)",
+                "longitud_dias": "Duración de la racha (días)",
+            },
+            title="Tu racha más larga según el requisito mínimo de minutos/día",
+        )
+
+    res_artistas = _analitica["emergentes_olvidados"]
+    df_emergentes = res_artistas.get("emergentes", pd.DataFrame())
+    df_olvidados = res_artistas.get("olvidados", pd.DataFrame())
+
+    figuras["emergentes"] = None
+    if not df_emergentes.empty:
+        fig_em = px.bar(
+            df_emergentes,
+            x="artista",
+            y="delta",
+            title="Artistas emergentes",
+            labels = {
+                "artista": "Artista",
+                "delta": "Cambio en minutos primera mitad vs segunda mitad"
+            },
+            color_discrete_sequence=["#2ca02c"],
+        )
+        fig_em.update_layout(xaxis_tickangle=-45)
+        figuras["emergentes"] = fig_em
+
+    figuras["olvidados"] = None
+    if not df_olvidados.empty:
+        fig_ol = px.bar(
+            df_olvidados,
+            x="artista",
+            y="delta",
+            title="Artistas olvidados",
+            labels={"artista": "Artista", "delta": "Camio en minutos primera mitad vs segunda mitad."},
+            color_discrete_sequence=["#d62728"],
+        )
+        fig_ol.update_layout(xaxis_tickangle=-45)
+        figuras["olvidados"] = fig_ol
+
+    return figuras
+
+def render_tab_usuario(
+    frames: dict[str, pd.DataFrame], usuario: str, etiqueta: str, firma: tuple
+):
     """
     Renderiza la vista individual de un usuario (solo sus datos).
     """
-    df_user = df_conjunto[df_conjunto["usuario"] == usuario].copy()
+    df_user = frames.get(usuario, pd.DataFrame())
 
     if df_user.empty:
         st.info(f"No hay datos para {etiqueta}.")
         return
 
+    analitica = calcular_analitica_usuario(usuario, firma, df_user)
+    figuras = construir_figuras_usuario(usuario, etiqueta, firma, analitica)
+
     st.subheader(f"Visión general — {etiqueta}")
 
     col1, col2, col3 = st.columns(3)
 
     minutos_totales = df_user["minutos_reproducidos"].sum()
-    dias_unicos = df_user["fecha_reproduccion"].dt.date.nunique()
+    dias_unicos = df_user["fecha"].nunique()
     artistas_unicos = df_user["artista"].nunique()
 
     with col1:
@@ -194,48 +503,27 @@ def render_tab_usuario(df_conjunto: pd.DataFrame, usuario: str, etiqueta: str):
     # ---------- TOP ARTISTAS CON FOTO ----------
     st.markdown("### Tus artistas más escuchados")
 
-    df_top_art = top_artistas(df_user, n=10)
-
-    df_img_all = cargar_imagenes_artistas()
-
-    if not df_img_all.empty:
-        df_img_all = df_img_all.copy()
-        df_img_all["usuario"] = df_img_all["usuario"].astype(str).str.strip().str.lower()
-        df_img_all["artista"] = df_img_all["artista"].astype(str).str.strip()
-    else:
-        df_img_all = pd.DataFrame(columns=["usuario", "artista", "url_imagen"])
+    df_top_art = analitica["top_artistas"]
 
+    mtime_catalogo = _mtime(RUTA_IMAGENES_ARTISTAS)
+    img_dict = cargar_imagenes_artistas(mtime_catalogo)
     usuario_key = str(usuario).strip().lower()
-    df_img_art = df_img_all[df_img_all["usuario"] == usuario_key]
-
-
-    if isinstance(df_top_art, pd.Series):
-        df_top_art = df_top_art.rename_axis("artista").reset_index(name="minutos_reproducidos")
-    elif isinstance(df_top_art, pd.DataFrame) and not df_top_art.empty:
-        cols_art = list(df_top_art.columns)
-        col_artista = next((c for c in cols_art if "artista" in c.lower()), cols_art[0])
-        col_min = next((c for c in cols_art if "minuto" in c.lower()), None)
-        if col_min is None and len(cols_art) > 1:
-            col_min = cols_art[1]
-        df_top_art = df_top_art.rename(
-            columns={col_artista: "artista", col_min: "minutos_reproducidos"}
-        )
-    else:
-        df_top_art = pd.DataFrame(columns=["artista", "minutos_reproducidos"])
+
+    df_top_art = df_top_art.rename_axis("artista").reset_index(name="minutos_reproducidos")
 
     if not df_top_art.empty:
-        df_top_art = df_top_art.copy()
         df_top_art["artista"] = df_top_art["artista"].astype(str).str.strip()
 
-        df_merge = df_top_art.merge(
-            df_img_art[["artista", "url_imagen"]],
-            on="artista",
-            how="left",
+        df_top_art["url_imagen"] = df_top_art["artista"].map(
+            lambda a: img_dict.get((usuario_key, a))
+        )
+        miniaturas = miniaturas_artistas(
+            mtime_catalogo, firma_imagenes_artistas(img_dict), size=160
         )
 
         # Grid de tarjetas (2 filas x 5 columnas máx)
-        for i in range(0, len(df_merge), 5):
-            fila = df_merge.iloc[i:i+5]
+        for i in range(0, len(df_top_art), 5):
+            fila = df_top_art.iloc[i:i+5]
             cols = st.columns(len(fila))
             for col_st, (_, row) in zip(cols, fila.iterrows()):
                 with col_st:
@@ -245,17 +533,15 @@ def render_tab_usuario(df_conjunto: pd.DataFrame, usuario: str, etiqueta: str):
                         if url.startswith("http://") or url.startswith("https://"):
                             st.image(url, width=160)
                         else:
+                            img_proc = miniaturas.get((usuario_key, row["artista"]))
                             ruta_img = RUTA_RAIZ / url
-                            if ruta_img.exists():
-                                img_proc = imagen_cuadrada(str(ruta_img), size=160)
-                                if img_proc is not None:
-                                    st.image(img_proc, width=160)
-                                else:
-                                    st.write("🖼️")
+                            if img_proc is None and ruta_img.exists():
+                                # Reintento si falló al armar las miniaturas
+                                img_proc = _imagen_cuadrada_o_none(ruta_img, size=160)
+                            if img_proc is not None:
+                                st.image(img_proc, width=160)
                             else:
                                 st.write("🖼️")
-
-
                     else:
                         st.write("🖼️")
                     st.markdown(f"**{row['artista']}**")
@@ -265,48 +551,18 @@ def render_tab_usuario(df_conjunto: pd.DataFrame, usuario: str, etiqueta: str):
 
 
     st.markdown("**Top canciones del año**")
-    df_top_songs = top_canciones(df_user, n=10)
-    if not df_top_songs.empty:
-        cols = list(df_top_songs)
-        if len(cols) >= 2:
-            posibles_y = [c for c in cols if "minutos" in c.lower()]
-            if posibles_y:
-                y_col = posibles_y[0]
-                x_posibles = [c for c in cols if c != y_col]
-                x_col = x_posibles[0] if x_posibles else cols[0]
-            else:
-                x_col, y_col = cols[0], cols[1]
-            
-            fig_top_songs = px.bar(
-                df_top_songs,
-                x=x_col,
-                y=y_col,
-                title = "Tus canciones más escuchadas",
-                labels={x_col: "Canción", y_col: "Minutos reproducidos"},
-                color_discrete_sequence=["#9467bd"],
-            )
-            fig_top_songs.update_layout(xaxis_tickangle=-45)
-            st.plotly_chart(fig_top_songs, use_container_width=True)
-        df_top_songs = top_canciones(df_user, n=10)
+    if figuras["top_canciones"] is not None:
+        st.plotly_chart(figuras["top_canciones"], use_container_width=True)
 
     st.markdown("### Índice de obsesión (Top 1 / Top 5 / Top 10)")
-    obs = obsesion_multi(df_user)
+    obs = analitica["obsesion"]
     c1, c2, c3 = st.columns(3)
     c1.metric("Top 1", f"{obs['top_1']:.1f}%")
     c2.metric("Top 5", f"{obs['top_5']:.1f}%")
     c3.metric("Top 10", f"{obs['top_10']:.1f}%")
     st.markdown("Como se concentra tu escucha")
-    df_pastel = preparar_pastel_obsesion(df_user)
-    if not df_pastel.empty:
-        fig_pastel = px.pie(
-            df_pastel,
-            names="segmento",
-            values="porcentaje",
-            hole=0.4,
-            title="Distribución de minutos entre tus artistas",
-        )
-        fig_pastel.update_traces(textposition="inside", textinfo="percent+label")
-        st.plotly_chart(fig_pastel, use_container_width=True)
+    if figuras["pastel_obsesion"] is not None:
+        st.plotly_chart(figuras["pastel_obsesion"], use_container_width=True)
     else:
         st.info("No hay información suficiente para el pastel de obsesión.")
     
@@ -314,29 +570,8 @@ def render_tab_usuario(df_conjunto: pd.DataFrame, usuario: str, etiqueta: str):
     st.markdown("---")
 
     st.markdown("### Ritmo del año: minutos por mes")
-    df_min = minutos_por_anio_mes(df_user)
-
-    if not df_min.empty:
-        df_min["anio_mes"] = pd.to_datetime(
-            df_min["anio"].astype(str)
-            + "-"
-            + df_min["mes"].astype(str)
-            + "-01"
-        )
-
-        fig = px.line(
-            df_min,
-            x="anio_mes",
-            y="minutos_reproducidos",
-            markers=True,
-            labels={
-                "anio_mes": "Mes",
-                "minutos_reproducidos": "Minutos reproducidos",
-            },
-            title=f"Minutos reproducidos por mes — {etiqueta}",
-            color_discrete_sequence=["#FF4B4B"],
-        )
-        st.plotly_chart(fig, use_container_width=True)
+    if figuras["minutos_mes"] is not None:
+        st.plotly_chart(figuras["minutos_mes"], use_container_width=True)
     else:
         st.info("No hay datos suficientes para mostrar minutos por mes.")
 
@@ -347,66 +582,27 @@ def render_tab_usuario(df_conjunto: pd.DataFrame, usuario: str, etiqueta: str):
 
     with col_h1:
         st.markdown("**Minutos por día de la semana**")
-        df_dia = minutos_por_dia_semana(df_user)
 
-        if df_dia is None or len(df_dia) == 0:
+        if figuras["minutos_dia_semana"] is None:
             st.info("No hay datos para días de la semana.")
         else:
-            if isinstance(df_dia, pd.Series):
-                df_dia = df_dia.rename_axis("dia_semana").reset_index(name="minutos_reproducidos")
-            else:
-                if "dia_semana" not in df_dia.columns:
-                    df_dia = df_dia.reset_index()
-                    df_dia.columns = ["dia_semana", "minutos_reproducidos"]
-
-            fig_dia = px.bar(
-                df_dia,
-                x="dia_semana",
-                y="minutos_reproducidos",
-                labels={
-                    "dia_semana": "Día de la semana",
-                    "minutos_reproducidos": "Minutos reproducidos",
-                },
-                title="¿Qué días escuchas más?",
-                color_discrete_sequence=["#1f77b4"],
-            )
-            fig_dia.update_layout(xaxis_tickangle=-30)
-            st.plotly_chart(fig_dia, use_container_width=True)
+            st.plotly_chart(figuras["minutos_dia_semana"], use_container_width=True)
 
     with col_h2:
         st.markdown("**Minutos por bloque horario**")
-        df_bloques = minutos_por_bloque_horario(df_user)
 
-        if df_bloques is None or len(df_bloques) == 0:
+        if figuras["minutos_bloque"] is None:
             st.info("No hay datos para bloques horarios.")
         else:
-            if isinstance(df_bloques, pd.Series):
-                df_bloques = df_bloques.rename_axis("bloque_horario").reset_index(name="minutos_reproducidos")
-            else:
-                if "bloque_horario" not in df_bloques.columns:
-                    df_bloques = df_bloques.reset_index()
-                    df_bloques.columns = ["bloque_horario", "minutos_reproducidos"]
-
-            fig_bloques = px.bar(
-                df_bloques,
-                x="bloque_horario",
-                y="minutos_reproducidos",
-                labels={
-                    "bloque_horario": "Bloque horario",
-                    "minutos_reproducidos": "Minutos reproducidos",
-                },
-                title="¿En qué momento del día escuchas más?",
-                color_discrete_sequence=["#ff7f0e"],
-            )
-            st.plotly_chart(fig_bloques, use_container_width=True)
+            st.plotly_chart(figuras["minutos_bloque"], use_container_width=True)
 
     st.markdown("## Intensidad y consistencia")
 
     col_i1, col_i2, col_i3 = st.columns(3)
 
-    resumen_semana = resumen_entre_semana_vs_fin(df_user)
-    var_diaria = resumen_variabilidad_diaria(df_user)
-    racha_30 = racha_musical_mas_larga(df_user, umbral_minutos_dia=30)
+    resumen_semana = analitica["resumen_semana"]
+    var_diaria = analitica["variabilidad_diaria"]
+    racha_30 = analitica["racha_30"]
 
     if not resumen_semana.empty:
         fila_entre = resumen_semana[resumen_semana["grupo"] == "entre_semana"]
@@ -448,26 +644,15 @@ def render_tab_usuario(df_conjunto: pd.DataFrame, usuario: str, etiqueta: str):
         )
     
     st.markdown("### Rachas según intensidad mínima")
-    df_rachas = construir_df_rachas(df_user)
-    if not df_rachas.empty:
-        fig_rachas = px.bar(
-            df_rachas,
-            x="umbral_minutos_dia",
-            y="longitud_dias",
-            labels={
-                "umbral_minutos_dia": "Umbral (min/día)",
-                "longitud_dias": "Duración de la racha (días)",
-            },
-            title="Tu racha más larga según el requisito mínimo de minutos/día",
-        )
-        st.plotly_chart(fig_rachas, use_container_width=True)
+    if figuras["rachas"] is not None:
+        st.plotly_chart(figuras["rachas"], use_container_width=True)
     else:
         st.info("No se pudieron calcular las rachas por umbral.")
     
     st.markdown("---")
 
     st.markdown(" ## Artistas emergentes y artistas olvidados**")
-    res_artistas = artistas_emergentes_y_olvidados(df_user, top_n = 5)
+    res_artistas = analitica["emergentes_olvidados"]
     df_emergentes = res_artistas.get("emergentes", pd.DataFrame())
     df_olvidados = res_artistas.get("olvidados", pd.DataFrame())
     tabs_art = st.tabs(["Emergentes", "Olvidados"])
@@ -475,62 +660,57 @@ def render_tab_usuario(df_conjunto: pd.DataFrame, usuario: str, etiqueta: str):
         if not df_emergentes.empty:
             st.markdown("Artistas que **ganaron peso** en la segunda mitad del año.")
             st.dataframe(df_emergentes, use_container_width=True)
-            cols_em = list(df_emergentes.columns)
-            if len(cols_em) >= 2:
-                posibles_y = [c for c in cols_em if "minutos" in c.lower() or "delta" in c.lower()]
-                if posibles_y:
-                    y_col = posibles_y[0]
-                    x_posibles = [c for c in cols_em if c != y_col]
-                    x_col = x_posibles[0] if x_posibles else cols_em[0]
-                else:
-                    x_col, y_col = cols_em[0], cols_em[1]
-                fig_em = px.bar(
-                    df_emergentes,
-                    x=x_col,
-                    y=y_col,
-                    title="Artistas emergentes",
-                    labels = {
-                        x_col: "Artista",
-                        y_col: "Cambio en minutos primera mitad vs segunda mitad"
-                    },
-                    color_discrete_sequence=["#2ca02c"],
-                )
-                fig_em.update_layout(xaxis_tickangle=-45)
-                st.plotly_chart(fig_em, use_container_width=True)
+            st.plotly_chart(figuras["emergentes"], use_container_width=True)
         else:
             st.info("No se detectaron artistas emergentes.")
     with tabs_art[1]:
         if not df_olvidados.empty:
             st.markdown("Artistas que **perdieron peso** en la segunda mitad del año.")
             st.dataframe(df_olvidados, use_container_width=True)
-            cols_ol = list(df_olvidados.columns)
-            if len(cols_ol) >= 2:
-                posibles_y = [c for c in cols_ol if "minutos" in c.lower() or "delta" in c.lower()]
-                if posibles_y:
-                    y_col = posibles_y[0]
-                    x_posibles = [c for c in cols_ol if c != y_col]
-                    x_col = x_posibles[0] if x_posibles else cols_ol[0]
-                else:
-                    x_col, y_col = cols_ol[0], cols_ol[1]
-                fig_ol = px.bar(
-                    df_olvidados,
-                    x=x_col,
-                    y=y_col,
-                    title="Artistas olvidados",
-                    labels={x_col: "Artista", y_col: "Camio en minutos primera mitad vs segunda mitad."},
-                    color_discrete_sequence=["#d62728"],
-                )
-                fig_ol.update_layout(xaxis_tickangle=-45)
-                st.plotly_chart(fig_ol, use_container_width=True)
+            st.plotly_chart(figuras["olvidados"], use_container_width=True)
         else:
             st.info("No se detectaron artistas olvidados.")
 
-def render_tab_ambos(df_conjunto: pd.DataFrame):
+@st.cache_resource(show_spinner=False, max_entries=2)
+def construir_figura_mes_ambos(
+    firma: tuple, _analitica_elias: dict, _analitica_elie: dict
+):
+    """
+    Construye la gráfica comparativa de minutos por mes (Elias vs elie),
+    cacheada por la firma de los datos. Regresa None si no hay meses.
+    """
+    df_min_elias = _analitica_elias["minutos_mes"].assign(usuario="Elias")
+    df_min_elie = _analitica_elie["minutos_mes"].assign(usuario="elie")
+
+    # Solo se concatena si ambos lados tienen meses
+    partes = [d for d in (df_min_elias, df_min_elie) if not d.empty]
+    if not partes:
+        return None
+    if len(partes) > 1:
+        df_min = pd.concat(partes, ignore_index=True)
+    else:
+        df_min = partes[0]
+
+    return px.line(
+        df_min,
+        x="anio_mes",
+        y="minutos_reproducidos",
+        color="usuario",
+        markers=True,
+        labels={
+            "anio_mes": "Mes",
+            "minutos_reproducidos": "Minutos reproducidos",
+            "usuario": "Usuario",
+        },
+        title="Minutos reproducidos por mes — Elias vs elie",
+    )
+
+def render_tab_ambos(frames: dict[str, pd.DataFrame], firma: tuple):
     """
     Renderiza la pestaña comparativa Elias vs elie.
     """
-    df_elias = df_conjunto[df_conjunto["usuario"] == "Elias"].copy()
-    df_elie = df_conjunto[df_conjunto["usuario"] == "elie"].copy()
+    df_elias = frames.get("Elias", pd.DataFrame())
+    df_elie = frames.get("elie", pd.DataFrame())
 
     if df_elias.empty or df_elie.empty:
         st.info("Se necesitan datos de Elias y de elie para mostrar la comparación.")
@@ -554,8 +734,12 @@ def render_tab_ambos(df_conjunto: pd.DataFrame):
 
     st.markdown("### Comparación de obsesión (Top 1 / Top 5 / Top 10)")
 
-    obs_elias = obsesion_multi(df_elias)
-    obs_elie = obsesion_multi(df_elie)
+    # Mismo caché que las pestañas individuales
+    analitica_elias = calcular_analitica_usuario("Elias", firma, df_elias)
+    analitica_elie = calcular_analitica_usuario("elie", firma, df_elie)
+
+    obs_elias = analitica_elias["obsesion"]
+    obs_elie = analitica_elie["obsesion"]
 
     col_a, col_b = st.columns(2)
 
@@ -577,33 +761,9 @@ def render_tab_ambos(df_conjunto: pd.DataFrame):
 
     st.markdown("### Minutos por mes — comparativo")
 
-    df_min_elias = minutos_por_anio_mes(df_elias).assign(usuario="Elias")
-    df_min_elie = minutos_por_anio_mes(df_elie).assign(usuario="elie")
-
-    df_min = pd.concat([df_min_elias, df_min_elie], ignore_index=True)
-
-    if not df_min.empty:
-        df_min["anio_mes"] = pd.to_datetime(
-            df_min["anio"].astype(str)
-            + "-"
-            + df_min["mes"].astype(str)
-            + "-01"
-        )
-
-        fig = px.line(
-            df_min,
-            x="anio_mes",
-            y="minutos_reproducidos",
-            color="usuario",
-            markers=True,
-            labels={
-                "anio_mes": "Mes",
-                "minutos_reproducidos": "Minutos reproducidos",
-                "usuario": "Usuario",
-            },
-            title="Minutos reproducidos por mes — Elias vs elie",
-        )
-        st.plotly_chart(fig, use_container_width=True)
+    fig_mes = construir_figura_mes_ambos(firma, analitica_elias, analitica_elie)
+    if fig_mes is not None:
+        st.plotly_chart(fig_mes, use_container_width=True)
     else:
         st.info("No hay datos suficientes para mostrar minutos por mes.")
 
@@ -624,21 +784,22 @@ def main():
     if df_elias.empty and df_elie.empty:
         st.stop()
 
-    df_conjunto = preparar_df_conjunto(df_elias, df_elie)
-    if df_conjunto.empty:
+    firma = firma_datos()
+    frames = preparar_df_conjunto_enriquecido(df_elias, df_elie, firma)
+    if not frames:
         st.info("No se pudo construir el dataframe conjunto.")
         st.stop()
 
     tab_elias, tab_elie, tab_ambos = st.tabs(["Elias", "elie", "Ambos"])
 
     with tab_elias:
-        render_tab_usuario(df_conjunto, usuario="Elias", etiqueta="Elias")
+        render_tab_usuario(frames, usuario="Elias", etiqueta="Elias", firma=firma)
 
     with tab_elie:
-        render_tab_usuario(df_conjunto, usuario="elie", etiqueta="elie")
+        render_tab_usuario(frames, usuario="elie", etiqueta="elie", firma=firma)
 
     with tab_ambos:
-        render_tab_ambos(df_conjunto)
+        render_tab_ambos(frames, firma=firma)
 
 
 if __name__ == "__main__":